@@ -1,5 +1,17 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import geopandas as gpd
+import shapely
+from joblib import Parallel, delayed
+from pyogrio import read_dataframe, read_info
+from pyogrio.errors import DataSourceError
+
+# Use pyogrio for any read/write that doesn't pass engine= explicitly
+gpd.options.io_engine = "pyogrio"
 
 
 # ---------- CONFIG ----------
@@ -7,6 +19,7 @@ PARCELS_FILE         = "data_local/parcels_citywide.geojson"
 PROJECTS_PARCELS_CSV = "data_local/project_parcels.csv"
 PROJECT_LIST_CSV     = "data_local/project_list.csv"
 CUSTOM_PARCELS       = "data_local/custom_parcels.geojson"
+PARCELS_CACHE        = "data_local/_parcels_cache.parquet"  # built by cache_parcels.py
 
 PARCEL_KEY_COL       = "PIN"                # unique ID in parcel data
 PARCEL_ADDRESS_COL   = "MAILTOADD"          # readable address
@@ -15,37 +28,142 @@ PARCEL_SDAT_COL      = "SDATLINK"           # link to SDAT detail page
 OUT_UNDER_CONSTRUCTION          = "data/UNDER_CONSTRUCTION.geojson"
 OUT_COMPLETED_2025    = "data/COMPLETED_2025.geojson"
 OUT_COMPLETED_2026    = "data/COMPLETED_2026.geojson"
-SIMPLIFY_TOL         = 0.00005              # tweak if polygons feel heavy
+OUT_PROJECT_POLYS     = "data_local/_project_polys.fgb"  # binary intermediate; web layers stay GeoJSON
+SIMPLIFY_TOL         = 0.00005              # tweak if polygons feel heavy (convex-hull fallback only)
+CONCAVE_RATIO        = 0.3                  # lower = tighter hull around project parcels
+GEOJSON_PRECISION    = 6                    # ~10 cm at Baltimore's latitude; fewer digits = smaller files
+CHUNK_FEATURES       = 100_000              # parcels per streamed read chunk
+
+
+@dataclass(frozen=True)
+class OutputSpec:
+    """One published layer: where it goes and which projects it keeps."""
+    path: str
+    status: str
+    completed_year: int | None = None
+
+    def mask(self, gdf):
+        m = gdf["project_status"] == self.status
+        if self.completed_year is not None:
+            m &= gdf["completed_year"] == self.completed_year
+        return m
+
+
+OUTPUTS = [
+    OutputSpec(OUT_UNDER_CONSTRUCTION, "Under Construction"),
+    OutputSpec(OUT_COMPLETED_2025, "Completed", 2025),
+    OutputSpec(OUT_COMPLETED_2026, "Completed", 2026),
+]
 # -----------------------------
 
 
-def load_parcels():
-    
-    print("Load geometries")
-    parcels = gpd.read_file(PARCELS_FILE)
+def pin_hash_key(pins):
+    """uint64 key for a PIN column; pandas hash-joins ints much faster than strings."""
+    return pd.util.hash_array(pins.to_numpy(dtype=object))
+
+
+def simplify_parallel(geoms, tolerance):
+    """Chunked shapely.simplify across a threadpool.
+
+    shapely 2 releases the GIL around GEOS calls, so threads scale with
+    cores on large geometry arrays.
+    """
+    chunks = np.array_split(geoms, os.cpu_count() or 1)
+    out = Parallel(n_jobs=-1, prefer="threads")(
+        delayed(shapely.simplify)(c, tolerance, preserve_topology=True) for c in chunks
+    )
+    return np.concatenate(out)
+
+
+def cache_is_fresh():
+    """True if the parquet cache exists and is newer than its sources."""
+    if not os.path.exists(PARCELS_CACHE):
+        return False
+    cache_mtime = os.path.getmtime(PARCELS_CACHE)
+    for src in (PARCELS_FILE, CUSTOM_PARCELS):
+        if os.path.exists(src) and os.path.getmtime(src) > cache_mtime:
+            return False
+    return True
+
+
+def load_parcels(pin_set=None):
 
-    if parcels.crs is None or parcels.crs.to_epsg() != 4326:
+    if cache_is_fresh():
+        print("Load geometries (parquet cache)")
+        parcels = gpd.read_parquet(PARCELS_CACHE, use_threads=True, memory_map=True)
+        if pin_set is not None:
+            parcels = parcels[parcels[PARCEL_KEY_COL].isin(pin_set)]
+        print(f"    Loaded {len(parcels)} cached shapes")
+        return parcels
+
+    return load_parcels_from_source(pin_set)
+
+
+def load_parcels_from_source(pin_set=None):
+
+    print("Load geometries")
+    if pin_set is None:
+        # Full layer needed (cache build): read it in one shot
+        parcels = gpd.read_file(PARCELS_FILE, engine="pyogrio", use_arrow=True)
+
+        # Normalize parcel key to Arrow-backed string (str kernels run in C)
+        parcels[PARCEL_KEY_COL] = parcels[PARCEL_KEY_COL].astype("string[pyarrow]").str.strip()
+    else:
+        # Stream the citywide file in chunks, keeping only project
+        # parcels, so peak memory is one chunk instead of the whole
+        # layer - and reprojection only touches the ~1% of rows we keep
+        n_features = read_info(PARCELS_FILE)["features"]
+        chunks = []
+        for start in range(0, n_features, CHUNK_FEATURES):
+            chunk = read_dataframe(
+                PARCELS_FILE,
+                skip_features=start,
+                max_features=CHUNK_FEATURES,
+                use_arrow=True,
+            )
+            chunk[PARCEL_KEY_COL] = chunk[PARCEL_KEY_COL].astype("string[pyarrow]").str.strip()
+            chunks.append(chunk[chunk[PARCEL_KEY_COL].isin(pin_set)])
+        parcels = pd.concat(chunks, ignore_index=True)
+
+    # Only reproject when the CRS is genuinely different from 4326;
+    # crs.equals also catches WKT-only CRSes equivalent to 4326, where
+    # to_epsg() would force a needless full-layer transform
+    if parcels.crs is None:
+        parcels = parcels.set_crs(4326)
+    elif not parcels.crs.equals("EPSG:4326"):
         parcels = parcels.to_crs(4326)
-   
-    # Normalize parcel key to string
-    parcels[PARCEL_KEY_COL] = parcels[PARCEL_KEY_COL].astype(str).str.strip()
+
     print(f"    Loaded {len(parcels)} city parcels")
 
 
     #Load custom polygons (optional override/supplement)
     try:
-        custom = gpd.read_file(CUSTOM_PARCELS)
-        if custom.crs is None or custom.crs.to_epsg() != 4326:
+        custom = gpd.read_file(CUSTOM_PARCELS, engine="pyogrio", use_arrow=True)
+        custom[PARCEL_KEY_COL] = custom[PARCEL_KEY_COL].astype("string[pyarrow]").str.strip()
+        if pin_set is not None:
+            custom = custom[custom[PARCEL_KEY_COL].isin(pin_set)]
+        if custom.crs is None:
+            custom = custom.set_crs(4326)
+        elif not custom.crs.equals("EPSG:4326"):
             custom = custom.to_crs(4326)
-        custom[PARCEL_KEY_COL] = custom[PARCEL_KEY_COL].astype(str).str.strip()
         print(f"    Loaded {len(custom)} custom parcels")
-        
-        parcels = pd.concat([parcels, custom], ignore_index=True)
+
+        # Concat through Arrow over just the columns used downstream:
+        # pd.concat would realign and copy every citywide column
+        keep_cols = [PARCEL_KEY_COL, PARCEL_ADDRESS_COL, PARCEL_SDAT_COL]
+        tables = []
+        for gdf in (parcels, custom):
+            cols = [c for c in keep_cols if c in gdf.columns] + [gdf.geometry.name]
+            tables.append(pa.table(gdf[cols].to_arrow()))
+        combined = pa.concat_tables(tables, promote_options="permissive")
+        parcels = gpd.GeoDataFrame.from_arrow(combined)
         print(f"    Combined into {len(parcels)} total shapes")
        
 
 
-    except FileNotFoundError:
+    except (FileNotFoundError, DataSourceError):
+        # pyogrio raises DataSourceError (not FileNotFoundError) when
+        # the path is missing
         print("No custom_parcels.geojson found; skipping custom geometries.")
 
     return parcels
@@ -57,10 +175,30 @@ def load_projects_table():
 
     print("Load CSVs")
     #load parcel csv file and retain all columns except project_name
-    parcels_tbl = pd.read_csv(PROJECTS_PARCELS_CSV, dtype={"parcel_id": str, "project_id": str})
-    
+    # pyarrow engine parses in parallel and keeps strings Arrow-backed,
+    # so the downstream endswith/isin kernels stay vectorized
+    parcels_tbl = pd.read_csv(
+        PROJECTS_PARCELS_CSV,
+        engine="pyarrow",
+        dtype_backend="pyarrow",
+        dtype={"parcel_id": "string[pyarrow]", "project_id": "string[pyarrow]"},
+    )
+
     #load project list csv file and retain all columns
-    proj_list = pd.read_csv(PROJECT_LIST_CSV,dtype={"project_id": str, "project_name": str,"project_status": str, "completed_year":str, "project_link": str, "image_url": str, "photo_date": str})
+    proj_list = pd.read_csv(
+        PROJECT_LIST_CSV,
+        engine="pyarrow",
+        dtype_backend="pyarrow",
+        dtype={
+            "project_id": "string[pyarrow]",
+            "project_name": "string[pyarrow]",
+            "project_status": "string[pyarrow]",
+            "completed_year": "int16[pyarrow]",
+            "project_link": "string[pyarrow]",
+            "image_url": "string[pyarrow]",
+            "photo_date": "string[pyarrow]",
+        },
+    )
 
     print(f"    project_parcels.csv: {len(parcels_tbl)} parcels")
     print(f"    project_list.csv: {len(proj_list)} projects")
@@ -80,39 +218,20 @@ def load_projects_table():
 def build_project_layer(merged: gpd.GeoDataFrame):
     
     """
-    Builds:
-      - UNDER_CONSTRUCTION.geojson   (one feature per project_id)
-      - COMPLETED_2025.geojson (one feature per project_id)
-      - COMPLETED_2026.geojson (one feature per project_id)
+    Builds one GeoJSON file per entry in OUTPUTS
+    (one feature per project_id in each).
     """
        
-    # Split into non-custom vs custom based on PIN suffix
-    pin_str = merged[PARCEL_KEY_COL].astype(str)
-    mask_custom = pin_str.str.endswith("CUST")
-
-    non_custom = merged[~mask_custom].copy()
-    custom     = merged[mask_custom].copy()
+    # Split into non-custom vs custom based on PIN suffix.
+    # PIN is string[pyarrow] (set at load), so endswith is Arrow's
+    # ends_with kernel over a contiguous buffer, not a Python loop
+    mask_custom = merged[PARCEL_KEY_COL].str.endswith("CUST").to_numpy(dtype=bool, na_value=False)
 
+    # Plain slices here: the groupby and the column selections below
+    # each produce fresh frames, so copying up front would just double RSS
+    non_custom = merged.loc[~mask_custom]
+    custom     = merged.loc[mask_custom]
 
-    # Dissolve non-custom parcels by project_id
-    # This gives us one row per project_id
-
-    #Add  additional fields here.
-    agg = {
-        "project_id": "first",
-        "project_name": "first",
-        "project_status": "first",
-        "completed_year": "first",
-        "project_link": "first",
-        "image_url":"first",
-        "photo_date":"first"
-    }
-
-    dissolved = non_custom.dissolve(by="project_id", aggfunc=agg)
-    dissolved = dissolved.reset_index(drop=True)
-
-    #Convex hull = clean single polygon around them
-    dissolved["geometry"] = dissolved.geometry.convex_hull
 
     keep = [
         "project_id",
@@ -124,69 +243,100 @@ def build_project_layer(merged: gpd.GeoDataFrame):
         "photo_date"
     ]
 
+    # Group non-custom parcels by project_id: one row per project.
+    # The hull ignores interior detail anyway, so instead of dissolve's
+    # unary_union we hull each group's raw coordinates directly - one
+    # GEOS call per project, no union pass.
+    grouped = non_custom.groupby("project_id", observed=True, sort=False)
+
+    attrs = grouped[[c for c in keep if c != "project_id"]].first().reset_index()
+
+    # A concave hull (GEOS >= 3.11) hugs the parcels instead of
+    # over-claiming land the way a convex hull does on sparse projects,
+    # and already yields a minimal vertex set - no simplify needed
+    use_concave = shapely.geos_version >= (3, 11, 0)
+
+    def project_hull(geoms):
+        points = shapely.multipoints(shapely.get_coordinates(np.asarray(geoms.values)))
+        if use_concave:
+            return shapely.concave_hull(points, ratio=CONCAVE_RATIO)
+        return shapely.convex_hull(points)
+
+    hulls = [project_hull(geoms) for _, geoms in grouped["geometry"]]
+
     #Create non-custom geodataframe
     gdf_non_custom = gpd.GeoDataFrame(
-        dissolved[keep + ["geometry"]].copy(),
+        attrs[keep],
+        geometry=hulls,
         crs="EPSG:4326",
     )
 
-    gdf_non_custom["geometry"] = gdf_non_custom.geometry.simplify(
-        SIMPLIFY_TOL, preserve_topology=True
-    )
-
-    # filter custom parcels to project_props and geometry
-    gdf_custom = gpd.GeoDataFrame(
-        custom[keep + ["geometry"]].copy(),
-        crs="EPSG:4326",
-    )
+    if not use_concave:
+        # Convex-hull fallback over-covers and carries extra vertices;
+        # thin them out before publishing
+        simplified = simplify_parallel(
+            np.asarray(gdf_non_custom.geometry.values), SIMPLIFY_TOL
+        )
+        gdf_non_custom["geometry"] = gpd.GeoSeries(
+            simplified, index=gdf_non_custom.index, crs="EPSG:4326"
+        )
+
+    # filter custom parcels to project props and geometry; plain column
+    # selection keeps the geometry column and CRS (custom is already a
+    # 4326 GeoDataFrame) without re-validating every geometry
+    gdf_custom = custom.loc[:, keep + ["geometry"]]
 
     #append gdf_non_custom and gdf_custom
     gdf_combined = pd.concat([gdf_non_custom, gdf_custom], ignore_index=True)
 
+    # Keep the combined layer as FlatGeobuf: packed binary coordinates,
+    # much faster to write/reread than GeoJSON text
+    gdf_combined.to_file(OUT_PROJECT_POLYS, driver="FlatGeobuf", engine="pyogrio")
+    print(f"Wrote {OUT_PROJECT_POLYS}")
 
-    #split into two publishable layers
-    under_construction = gdf_combined[gdf_combined["project_status"] == "Under Construction"].copy()
-    completed_2025 = gdf_combined[(gdf_combined["project_status"] == "Completed") & (gdf_combined["completed_year"].astype(str) == "2025")].copy()
-    completed_2026 = gdf_combined[(gdf_combined["project_status"] == "Completed") & (gdf_combined["completed_year"].astype(str) == "2026")].copy()
-
-
+    #split into the publishable layers, one per OutputSpec
     print("Creating project geometry")
-    print(f"    Under Construction:     {len(under_construction)} projects")
-    print(f"    Completed 2025:         {len(completed_2025)} projects")
-    print(f"    Completed 2026:         {len(completed_2026)} projects")
-
+    for spec in OUTPUTS:
+        layer = gdf_combined[spec.mask(gdf_combined)]
+        print(f"    {spec.path}: {len(layer)} projects")
+        layer.to_file(spec.path, driver="GeoJSON", engine="pyogrio", COORDINATE_PRECISION=GEOJSON_PRECISION)
+        print(f"Wrote {spec.path}")
 
 
-    under_construction.to_file(OUT_UNDER_CONSTRUCTION, driver="GeoJSON")
-    completed_2025.to_file(OUT_COMPLETED_2025, driver="GeoJSON")
-    completed_2026.to_file(OUT_COMPLETED_2026, driver="GeoJSON")
 
 
-    print(f"Wrote {OUT_UNDER_CONSTRUCTION}")
-    print(f"Wrote {OUT_COMPLETED_2025}")
-    print(f"Wrote {OUT_COMPLETED_2026}")
-
 
+def main():
 
+    project_data = load_projects_table()
 
+    # Only a small fraction of citywide parcels belong to a project;
+    # filtering by PIN up front keeps the transform and merge small
+    pin_set = set(project_data["parcel_id"])
 
-def main():
+    parcels = load_parcels(pin_set)
 
-    parcels  = load_parcels()
 
-    project_data = load_projects_table()
+    # Join on a precomputed uint64 hash of the PIN rather than the
+    # string columns themselves; the original PIN/parcel_id strings
+    # stay on the frame for the output
+    parcels["_pin_key"] = pin_hash_key(parcels[PARCEL_KEY_COL])
+    project_data["_pin_key"] = pin_hash_key(project_data["parcel_id"])
 
-      
     merged = parcels.merge(
         project_data,
-        left_on=PARCEL_KEY_COL,
-        right_on="parcel_id",
+        on="_pin_key",
         how="inner",
         suffixes=("", "_proj"),
-    )
+    ).drop(columns="_pin_key")
 
     merged = merged.rename(columns={"project_name_y": "project_name"})
-    
+
+    # Categorical keys let the project groupby run on int codes instead
+    # of hashing a Python string per parcel
+    for col in ("project_id", "project_name", "project_link"):
+        merged[col] = merged[col].astype("category")
+
     build_project_layer(merged)
     print("Complete")
 
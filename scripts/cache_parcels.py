@@ -0,0 +1,20 @@
+"""
+Parse the citywide parcels GeoJSON once and cache it as GeoParquet.
+
+Run this after refreshing data_local/parcels_citywide.geojson or
+data_local/custom_parcels.geojson; build_layers.py will then read the
+parquet cache instead of re-parsing the GeoJSON on every run.
+"""
+
+from build_layers import PARCELS_CACHE, load_parcels_from_source
+
+
+def main():
+    parcels = load_parcels_from_source()
+
+    parcels.to_parquet(PARCELS_CACHE)
+    print(f"Wrote {PARCELS_CACHE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,17 @@
-import geopandas as gpd
+from pyogrio import read_dataframe, read_info
 
 PARCELS_FILE = "data_local/parcels_citywide.geojson"
 
-gdf = gpd.read_file(PARCELS_FILE)
+# read_info only touches the layer header/schema, so this stays fast
+# even on the full citywide file (no geometries are materialized)
+info = read_info(PARCELS_FILE)
+
+print("CRS:", info["crs"])
+print("Features:", info["features"])
 
-print("CRS:", gdf.crs)
 print("\nColumns:")
-#print(list(gdf.columns))
-print(gdf.columns)
+print(list(info["fields"]))
 
 
 print("\nExample row:")
-print(gdf.head(1).T)
\ No newline at end of file
+print(read_dataframe(PARCELS_FILE, max_features=1).T)